@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-import os, time, json, requests
+import os, re, time, json, threading, requests
 from flask import Flask, request, Response, jsonify
 from prometheus_client import Gauge, Counter, generate_latest, CONTENT_TYPE_LATEST
 
@@ -22,12 +22,46 @@ MAX_RATE = float(os.getenv('MAX_RATE', '1.0'))
 STEP     = float(os.getenv('STEP',     '0.1'))
 COOLDOWN = int(os.getenv('COOLDOWN_SEC', '10'))
 
+# Control mode: 'step' (thresholds only) or 'budget' (target a telemetry volume)
+MODE = os.getenv('CONTROL_MODE', 'step')
+BUDGET_EVENTS = float(os.getenv('BUDGET_EVENTS_PER_SEC', '0'))  # 0 = disabled
+BUDGET_BYTES  = float(os.getenv('BUDGET_BYTES_PER_SEC',  '0'))  # 0 = disabled
+BUDGET_COMPONENTS = [c.strip() for c in os.getenv('BUDGET_COMPONENTS', 'statsd_metrics,app_logs').split(',') if c.strip()]
+BUDGET_DEADBAND = float(os.getenv('BUDGET_DEADBAND', '0.02'))
+
+
+# PromQL duration: units in decreasing order, each at most once (e.g. 1h30m, 500ms, 1d)
+_DURATION_RE = re.compile(r'(?:(\d+)y)?(?:(\d+)w)?(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?(?:(\d+)ms)?')
+_DURATION_UNITS = (365 * 86400, 7 * 86400, 86400, 3600, 60, 1, 0.001)
+
+
+def parse_duration(value) -> float:
+    """Seconds for a PromQL duration ('1m30s', '500ms', '1d') or a plain number of seconds."""
+    value = str(value).strip()
+    m = _DURATION_RE.fullmatch(value)
+    if value and m:
+        return float(sum(int(n) * u for n, u in zip(m.groups(), _DURATION_UNITS) if n))
+    return float(value)
+
 app = Flask(__name__)
 
+# Shared state: mutated by the poll loop and the HTTP handlers, guarded by STATE_LOCK.
+# Outbound pushes to go-api (slow, blocking) happen outside it, one at a time (APPLY_LOCK).
+STATE_LOCK = threading.Lock()
+APPLY_LOCK = threading.Lock()
+rate = MAX_RATE
+last_change_ts = 0.0
+_applied_rate = MAX_RATE
+_force_pending = False
+_poller = None
+_poller_stop = threading.Event()
+
 # Prometheus metrics for controller itself
 G_RATE = Gauge('controller_sampling_rate', 'Current sampling rate as seen/applied by controller')
 G_LAST_CHANGE = Gauge('controller_last_change_timestamp_seconds', 'Unix timestamp of last sampling change')
 C_DECISIONS = Counter('controller_decisions_total', 'Number of decisions taken', ['action', 'src'])
+G_VOLUME = Gauge('controller_telemetry_volume_per_second', 'Observed Vector ingest volume for budgeted components', ['unit'])
+G_BUDGET_TARGET = Gauge('controller_budget_target_rate', 'Sampling rate required to stay under the telemetry budget')
 
 
 def jlog(event: str, **fields):
@@ -38,6 +72,17 @@ def jlog(event: str, **fields):
         print('LOG', event, fields, flush=True)
 
 
+# Observed volume is rate(...[WINDOW]): wait that long after a change before re-targeting
+try:
+    WINDOW_SEC = parse_duration(WINDOW)
+    if not WINDOW_SEC > 0:
+        raise ValueError('must be positive')
+except ValueError as e:
+    # WINDOW also goes into the PromQL range selectors: fall back to a known-good value
+    jlog('config_invalid', name='WINDOW', value=WINDOW, error=str(e), fallback='30s')
+    WINDOW, WINDOW_SEC = '30s', 30.0
+
+
 def q_err_rate(window: str) -> str:
     return f'sum(rate(api_errors_total[{window}])) / clamp_min(sum(rate(api_requests_total[{window}])), 1e-9)'
 
@@ -46,6 +91,12 @@ def q_p90(window: str) -> str:
     return f'histogram_quantile(0.9, sum(rate(api_request_duration_seconds_bucket[{window}])) by (le))'
 
 
+def q_vector_volume(window: str, unit: str) -> str:
+    # unit: 'events' or 'bytes' (vector_component_received_{unit}_total)
+    comps = '|'.join(BUDGET_COMPONENTS)
+    return f'sum(rate(vector_component_received_{unit}_total{{component_id=~"{comps}"}}[{window}]))'
+
+
 def prom_query(q: str):
     try:
         r = requests.get(f"{PROM_URL}/api/v1/query", params={'query': q}, timeout=5)
@@ -75,6 +126,36 @@ def adjust(rate: float, up: bool) -> float:
     return round(rate, 3)
 
 
+def decide(err, p90):
+    """Poll decision: 'bump' on high err OR high p90, 'decay' on low err AND low p90, else None."""
+    if err is None or p90 is None or p90 != p90:
+        return None
+    if err > ERR_HIGH or p90 > LAT_HIGH:
+        return 'bump'
+    if err < ERR_LOW and p90 < LAT_LOW:
+        return 'decay'
+    return None
+
+
+def budget_target(rate: float, events, bytes_):
+    """
+    Rate needed to keep observed volume under budget, assuming volume scales with rate.
+    Upward moves are limited to STEP per decision, like step mode.
+    """
+    targets = []
+    for observed, budget in ((events, BUDGET_EVENTS), (bytes_, BUDGET_BYTES)):
+        if budget <= 0 or observed is None or observed != observed:
+            continue
+        if observed <= 0:
+            targets.append(MAX_RATE)
+            continue
+        targets.append(rate * budget / observed)
+    if not targets:
+        return None
+    target = min(min(targets), rate + STEP)
+    return round(max(MIN_RATE, min(MAX_RATE, target)), 3)
+
+
 def get_current_rate() -> float:
     try:
         r = requests.get(f"{API_URL}/control/sampling", timeout=5)
@@ -85,12 +166,41 @@ def get_current_rate() -> float:
     return MAX_RATE
 
 
-def set_rate(rate: float):
+def set_rate(rate: float) -> bool:
     try:
         r = requests.get(f"{API_URL}/control/sampling", params={'rate': str(rate)}, timeout=5)
         jlog('set_rate', new_rate=rate, resp_code=r.status_code, resp_text=r.text.strip())
+        return r.ok
     except Exception as e:
         jlog('set_rate_failed', new_rate=rate, error=str(e))
+        return False
+
+
+def apply_rate(force: bool = False):
+    """
+    Push the latest rate to go-api, outside STATE_LOCK. Only one push runs at a time:
+    if one is in flight, return at once; the pusher re-reads `rate` (and a pending
+    force) until it is applied. A failed push is left for the next poll to retry.
+    """
+    global _applied_rate, _force_pending
+    if force:
+        _force_pending = True
+    while True:
+        if not APPLY_LOCK.acquire(blocking=False):
+            return
+        try:
+            while _force_pending or rate != _applied_rate:
+                forced, _force_pending = _force_pending, False
+                target = rate
+                if not set_rate(target):
+                    _force_pending = _force_pending or forced
+                    return
+                _applied_rate = target
+        finally:
+            APPLY_LOCK.release()
+        # A change (or force) that raced with the release is picked up by the next pass
+        if rate == _applied_rate and not _force_pending:
+            return
 
 
 @app.route('/healthz')
@@ -114,27 +224,27 @@ def control_from_alert():
         global last_change_ts, rate
         jlog('ctrl_alert', statuses=statuses)
 
-        now = time.time()
-        if firing and (now - last_change_ts >= COOLDOWN):
-            nr = adjust(rate, up=True)
-            if nr != rate:
-                jlog('ctrl_decision', action='bump', src='alert', from_rate=rate, to_rate=nr)
-                C_DECISIONS.labels(action='bump', src='alert').inc()
-                set_rate(nr)
-                rate = nr
-                G_RATE.set(rate)
-                last_change_ts = now
-                G_LAST_CHANGE.set(last_change_ts)
-        elif resolved_only and (now - last_change_ts >= COOLDOWN):
-            nr = adjust(rate, up=False)
-            if nr != rate:
-                jlog('ctrl_decision', action='decay', src='alert', from_rate=rate, to_rate=nr)
-                C_DECISIONS.labels(action='decay', src='alert').inc()
-                set_rate(nr)
-                rate = nr
-                G_RATE.set(rate)
-                last_change_ts = now
-                G_LAST_CHANGE.set(last_change_ts)
+        with STATE_LOCK:
+            now = time.time()
+            if firing and (now - last_change_ts >= COOLDOWN):
+                nr = adjust(rate, up=True)
+                if nr != rate:
+                    jlog('ctrl_decision', action='bump', src='alert', from_rate=rate, to_rate=nr)
+                    C_DECISIONS.labels(action='bump', src='alert').inc()
+                    rate = nr
+                    G_RATE.set(rate)
+                    last_change_ts = now
+                    G_LAST_CHANGE.set(last_change_ts)
+            elif resolved_only and (now - last_change_ts >= COOLDOWN):
+                nr = adjust(rate, up=False)
+                if nr != rate:
+                    jlog('ctrl_decision', action='decay', src='alert', from_rate=rate, to_rate=nr)
+                    C_DECISIONS.labels(action='decay', src='alert').inc()
+                    rate = nr
+                    G_RATE.set(rate)
+                    last_change_ts = now
+                    G_LAST_CHANGE.set(last_change_ts)
+        apply_rate()
         return 'ok\n'
     except Exception as e:
         return f'err {e}\n', 500
@@ -216,7 +326,7 @@ def api_state():
     try:
         err = prom_query(q_err_rate(WINDOW))
         p90 = prom_query(q_p90(WINDOW))
-        return {'rate': rate, 'err': err, 'p90': p90, 'last': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(last_change_ts)) if last_change_ts else None}
+        return {'rate': rate, 'err': err, 'p90': p90, 'mode': MODE, 'last': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(last_change_ts)) if last_change_ts else None}
     except Exception as e:
         return {'error': str(e)}, 500
 
@@ -224,86 +334,164 @@ def api_state():
 def api_rate():
     global rate, last_change_ts
     data = request.get_json(force=True, silent=True) or {}
-    now = time.time()
     if 'action' in data:
-        if now - last_change_ts < COOLDOWN:
-            return {'status':'cooldown','seconds_left': int(COOLDOWN - (now - last_change_ts))}, 429
-        if data['action'] == 'bump':
-            nr = adjust(rate, up=True)
-            if nr != rate:
-                C_DECISIONS.labels(action='bump', src='manual').inc()
-                set_rate(nr)
-                rate = nr; G_RATE.set(rate); last_change_ts = now; G_LAST_CHANGE.set(last_change_ts)
-        elif data['action'] == 'decay':
-            nr = adjust(rate, up=False)
-            if nr != rate:
-                C_DECISIONS.labels(action='decay', src='manual').inc()
-                set_rate(nr)
-                rate = nr; G_RATE.set(rate); last_change_ts = now; G_LAST_CHANGE.set(last_change_ts)
-        return {'rate': rate}
+        with STATE_LOCK:
+            now = time.time()
+            if now - last_change_ts < COOLDOWN:
+                return {'status':'cooldown','seconds_left': int(COOLDOWN - (now - last_change_ts))}, 429
+            if data['action'] == 'bump':
+                nr = adjust(rate, up=True)
+                if nr != rate:
+                    C_DECISIONS.labels(action='bump', src='manual').inc()
+                    rate = nr; G_RATE.set(rate); last_change_ts = now; G_LAST_CHANGE.set(last_change_ts)
+            elif data['action'] == 'decay':
+                nr = adjust(rate, up=False)
+                if nr != rate:
+                    C_DECISIONS.labels(action='decay', src='manual').inc()
+                    rate = nr; G_RATE.set(rate); last_change_ts = now; G_LAST_CHANGE.set(last_change_ts)
+            current = rate
+        apply_rate()
+        return {'rate': current}
     if 'value' in data:
         v = float(data['value'])
         v = max(MIN_RATE, min(MAX_RATE, round(v,3)))
-        set_rate(v)
-        rate = v; G_RATE.set(rate); last_change_ts = now; G_LAST_CHANGE.set(last_change_ts)
-        return {'rate': rate}
+        with STATE_LOCK:
+            now = time.time()
+            rate = v; G_RATE.set(rate); last_change_ts = now; G_LAST_CHANGE.set(last_change_ts)
+        apply_rate(force=True)
+        return {'rate': v}
     return {'error': 'invalid payload'}, 400
 
 
-if __name__ == '__main__':
-    from threading import Thread
 
-    # State
-    rate = get_current_rate()
-    last_change_ts = 0.0
-    G_RATE.set(rate)
-    G_LAST_CHANGE.set(last_change_ts)
+
+def check_config():
+    """Fail fast on a control mode the poll loop would not act on."""
+    error = None
+    if MODE not in ('step', 'budget'):
+        error = f"unknown CONTROL_MODE {MODE!r} (expected 'step' or 'budget')"
+    elif MODE == 'budget' and BUDGET_EVENTS <= 0 and BUDGET_BYTES <= 0:
+        error = 'CONTROL_MODE=budget needs BUDGET_EVENTS_PER_SEC or BUDGET_BYTES_PER_SEC > 0'
+    if error:
+        jlog('config_invalid', name='CONTROL_MODE', value=MODE, error=error)
+        raise ValueError(error)
+
+
+def init_state():
+    global rate, last_change_ts, _applied_rate
+    check_config()
+    with STATE_LOCK:
+        rate = get_current_rate()
+        _applied_rate = rate
+        last_change_ts = 0.0
+        G_RATE.set(rate)
+        G_LAST_CHANGE.set(last_change_ts)
     jlog('ctrl_start', rate=rate, window=WINDOW,
          thresholds={'err_low': ERR_LOW, 'err_high': ERR_HIGH, 'lat_low': LAT_LOW, 'lat_high': LAT_HIGH},
-         step=STEP, cooldown=COOLDOWN, service=SERVICE, env=ENV)
+         step=STEP, cooldown=COOLDOWN, service=SERVICE, env=ENV,
+         mode=MODE, budget={'events_per_sec': BUDGET_EVENTS, 'bytes_per_sec': BUDGET_BYTES, 'components': BUDGET_COMPONENTS})
 
-    # Start Flask (webhook + /metrics + /healthz)
-    def run_api():
-        app.run(host='0.0.0.0', port=8080)
 
-    Thread(target=run_api, daemon=True).start()
+def poll_once():
+    """One iteration of the polling loop (queries outside the lock, decision under it)."""
+    global rate, last_change_ts
+    err = prom_query(q_err_rate(WINDOW))
+    p90 = prom_query(q_p90(WINDOW))
+    jlog('ctrl_tick', err=err, p90=p90, rate=rate)
+    if err is None or p90 is None or p90 != p90:  # Check for NaN
+        return
+
+    signal = decide(err, p90)
+    events = bytes_ = None
+    if MODE == 'budget' and signal != 'bump':
+        events = prom_query(q_vector_volume(WINDOW, 'events')) if BUDGET_EVENTS > 0 else None
+        bytes_ = prom_query(q_vector_volume(WINDOW, 'bytes')) if BUDGET_BYTES > 0 else None
+        if events is not None:
+            G_VOLUME.labels(unit='events').set(events)
+        if bytes_ is not None:
+            G_VOLUME.labels(unit='bytes').set(bytes_)
+
+    with STATE_LOCK:
+        now = time.time()
+        target = budget_target(rate, events, bytes_) if MODE == 'budget' and signal != 'bump' else None
+        # Décision d'augmentation basée sur le taux d'erreur OU la latence (prioritaire sur le budget)
+        if signal == 'bump':
+            nr = adjust(rate, up=True)
+            if nr != rate:
+                jlog('ctrl_decision', action='bump', src='poll', from_rate=rate, to_rate=nr,
+                     reason={'err': err, 'p90': p90, 'thr_high': {'err': ERR_HIGH, 'p90': LAT_HIGH}})
+                C_DECISIONS.labels(action='bump', src='poll').inc()
+                rate = nr
+                G_RATE.set(rate)
+                last_change_ts = now
+                G_LAST_CHANGE.set(last_change_ts)
+        # Mode budget : hors incident, viser le taux qui respecte le volume cible
+        # (sans volume observé, on retombe sur la décroissance par seuils)
+        elif target is not None:
+            nr = target
+            G_BUDGET_TARGET.set(nr)
+            settled = now - last_change_ts >= WINDOW_SEC
+            if settled and abs(nr - rate) >= BUDGET_DEADBAND:
+                action = 'bump' if nr > rate else 'decay'
+                jlog('ctrl_decision', action=action, src='budget', from_rate=rate, to_rate=nr,
+                     reason={'events': events, 'bytes': bytes_,
+                             'budget': {'events': BUDGET_EVENTS, 'bytes': BUDGET_BYTES}})
+                C_DECISIONS.labels(action=action, src='budget').inc()
+                rate = nr
+                G_RATE.set(rate)
+                last_change_ts = now
+                G_LAST_CHANGE.set(last_change_ts)
+        # Décision de diminution basée sur le taux d'erreur ET la latence
+        elif signal == 'decay':
+            nr = adjust(rate, up=False)
+            if nr != rate:
+                jlog('ctrl_decision', action='decay', src='poll', from_rate=rate, to_rate=nr,
+                     reason={'err': err, 'p90': p90, 'thr_low': {'err': ERR_LOW, 'p90': LAT_LOW}})
+                C_DECISIONS.labels(action='decay', src='poll').inc()
+                rate = nr
+                G_RATE.set(rate)
+                last_change_ts = now
+                G_LAST_CHANGE.set(last_change_ts)
+    apply_rate()
 
-    # Polling loop
-    while True:
-        try:
-            err = prom_query(q_err_rate(WINDOW))
-            p90 = prom_query(q_p90(WINDOW))
-            jlog('ctrl_tick', err=err, p90=p90, rate=rate)
-            if err is None or p90 is None or p90 != p90:  # Check for NaN
-                time.sleep(INTERVAL)
-                continue
 
-            now = time.time()
-            # Décision d'augmentation basée sur le taux d'erreur OU la latence
-            if (err is not None and err > ERR_HIGH) or (p90 is not None and p90 == p90 and p90 > LAT_HIGH):
-                nr = adjust(rate, up=True)
-                if nr != rate:
-                    jlog('ctrl_decision', action='bump', src='poll', from_rate=rate, to_rate=nr,
-                         reason={'err': err, 'p90': p90, 'thr_high': {'err': ERR_HIGH, 'p90': LAT_HIGH}})
-                    C_DECISIONS.labels(action='bump', src='poll').inc()
-                    set_rate(nr)
-                    rate = nr
-                    G_RATE.set(rate)
-                    last_change_ts = now
-                    G_LAST_CHANGE.set(last_change_ts)
-            # Décision de diminution basée sur le taux d'erreur ET la latence
-            elif (err is not None and err < ERR_LOW) and (p90 is not None and p90 == p90 and p90 < LAT_LOW):
-                nr = adjust(rate, up=False)
-                if nr != rate:
-                    jlog('ctrl_decision', action='decay', src='poll', from_rate=rate, to_rate=nr,
-                         reason={'err': err, 'p90': p90, 'thr_low': {'err': ERR_LOW, 'p90': LAT_LOW}})
-                    C_DECISIONS.labels(action='decay', src='poll').inc()
-                    set_rate(nr)
-                    rate = nr
-                    G_RATE.set(rate)
-                    last_change_ts = now
-                    G_LAST_CHANGE.set(last_change_ts)
+def poll_loop(stop: threading.Event):
+    while not stop.is_set():
+        try:
+            poll_once()
         except Exception as e:
             jlog('loop_err', error=str(e))
-        time.sleep(INTERVAL)
+        stop.wait(INTERVAL)
 
+
+def start_poller():
+    """Initialise state and run the polling loop in a background thread (WSGI serving mode)."""
+    global _poller
+    if _poller is not None and _poller.is_alive():
+        return
+    init_state()
+    _poller_stop.clear()
+    _poller = threading.Thread(target=poll_loop, args=(_poller_stop,), name='poll-loop', daemon=True)
+    _poller.start()
+
+
+def stop_poller(timeout: float = 5.0):
+    _poller_stop.set()
+    if _poller is not None:
+        _poller.join(timeout)
+    jlog('ctrl_stop')
+
+
+if __name__ == '__main__':
+    # Dev mode: Flask dev server in a thread, polling loop in the main thread.
+    # Production: gunicorn -c gunicorn.conf.py app:app
+    init_state()
+
+    # Start Flask (webhook + /metrics + /healthz)
+    def run_api():
+        app.run(host='0.0.0.0', port=8080)
+
+    threading.Thread(target=run_api, daemon=True).start()
+
+    # Polling loop
+    poll_loop(_poller_stop)
@@ -0,0 +1,25 @@
+# Production serving for the controller: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+# Controller state (current rate, cooldown) lives in-process: exactly one worker,
+# concurrency comes from threads.
+workers = 1
+worker_class = 'gthread'
+threads = int(os.getenv('THREADS', '8'))
+keepalive = int(os.getenv('KEEPALIVE', '5'))
+timeout = int(os.getenv('TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '15'))
+preload_app = False
+accesslog = '-' if os.getenv('ACCESS_LOG', '0') == '1' else None
+
+
+def post_worker_init(worker):
+    # Poll loop runs next to the request threads, in the same worker process
+    from app import start_poller
+    start_poller()
+
+
+def worker_exit(server, worker):
+    from app import stop_poller
+    stop_poller()
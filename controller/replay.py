@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Offline replay of the controller poll loop over recorded err/p90 series.
+
+Runs the same decision rule as the live loop (app.decide + app.adjust) for many
+parameter sets at once: time is iterated, parameter sets are numpy vectors.
+
+Inputs:
+  - two Prometheus query_range exports (err rate and p90), e.g.
+      curl -G localhost:9091/api/v1/query_range --data-urlencode 'query=...' \
+           -d start=... -d end=... -d step=3 > err.json
+  - or the Vector NDJSON logs (err/p90 recomputed over a trailing WINDOW).
+    Info events are sampled by go-api, so err derived from logs is biased upward.
+
+Note: the live poll loop does not gate on COOLDOWN_SEC (only alert/manual
+changes do); COOLDOWN_SEC=0 (default here) reproduces it exactly.
+
+Example:
+  python replay.py --err err.json --p90 p90.json \
+      --sweep ERR_HIGH=0.02,0.05,0.1 --sweep STEP=0.05:0.3:6 --sweep COOLDOWN_SEC=0,10,30
+"""
+
+import argparse
+import itertools
+import json
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+import app as ctrl
+
+# Sweepable parameters -> default taken from the controller's env config
+PARAMS = {
+    'ERR_HIGH': ctrl.ERR_HIGH,
+    'ERR_LOW': ctrl.ERR_LOW,
+    'LAT_HIGH': ctrl.LAT_HIGH,
+    'LAT_LOW': ctrl.LAT_LOW,
+    'MIN_RATE': ctrl.MIN_RATE,
+    'MAX_RATE': ctrl.MAX_RATE,
+    'STEP': ctrl.STEP,
+    'COOLDOWN_SEC': 0.0,
+}
+
+
+def _parse_ts(s: str) -> float:
+    # RFC3339 with up to nanosecond precision (Vector timestamps)
+    s = s.rstrip('Z')
+    frac = 0.0
+    if '.' in s:
+        s, f = s.split('.', 1)
+        frac = float('0.' + f)
+    return datetime.fromisoformat(s).replace(tzinfo=timezone.utc).timestamp() + frac
+
+
+def load_prom_range(path: str):
+    """Load the first series of a /api/v1/query_range response -> (ts, values)."""
+    with open(path) as f:
+        data = json.load(f)
+    res = data.get('data', {}).get('result', [])
+    if not res:
+        return np.empty(0), np.empty(0)
+    values = res[0].get('values', [])
+    ts = np.array([float(v[0]) for v in values])
+    vals = np.array([float(v[1]) for v in values])  # "NaN" parses to nan
+    return ts, vals
+
+
+def align(err_series, p90_series):
+    """Keep only timestamps present in both series."""
+    (ts_e, err), (ts_p, p90) = err_series, p90_series
+    ts, ie, ip = np.intersect1d(ts_e, ts_p, return_indices=True)
+    return ts, err[ie], p90[ip]
+
+
+def load_ndjson(path: str, interval: float, window: float):
+    """Recompute err/p90 every `interval` seconds over a trailing `window` from NDJSON logs."""
+    ev_ts, ev_err, ev_lat = [], [], []
+    with open(path) as f:
+        for line in f:
+            try:
+                ev = json.loads(line)
+                if 'status' not in ev or 'latency_ms' not in ev:
+                    continue
+                ev_ts.append(_parse_ts(ev['timestamp']))
+                ev_err.append(int(ev['status']) >= 500)
+                ev_lat.append(float(ev['latency_ms']) / 1000.0)
+            except (ValueError, KeyError, TypeError):
+                continue
+    if not ev_ts:
+        return np.empty(0), np.empty(0), np.empty(0)
+    order = np.argsort(ev_ts)
+    ev_ts = np.asarray(ev_ts)[order]
+    ev_err = np.asarray(ev_err, dtype=float)[order]
+    ev_lat = np.asarray(ev_lat)[order]
+
+    ts = np.arange(ev_ts[0] + interval, ev_ts[-1] + interval, interval)
+    hi = np.searchsorted(ev_ts, ts, side='right')
+    lo = np.searchsorted(ev_ts, ts - window, side='right')
+    err = np.full(len(ts), np.nan)
+    p90 = np.full(len(ts), np.nan)
+    cum_err = np.concatenate(([0.0], np.cumsum(ev_err)))
+    for i, (a, b) in enumerate(zip(lo, hi)):
+        if b > a:
+            err[i] = (cum_err[b] - cum_err[a]) / (b - a)
+            p90[i] = np.quantile(ev_lat[a:b], 0.9)
+    return ts, err, p90
+
+
+def grid(**values):
+    """Cartesian product of parameter lists -> dict of equally sized arrays."""
+    names = list(PARAMS)
+    lists = [np.atleast_1d(values.get(n, PARAMS[n])).astype(float) for n in names]
+    combos = np.array(list(itertools.product(*lists)), dtype=float).reshape(-1, len(names))
+    return {n: combos[:, i] for i, n in enumerate(names)}
+
+
+def simulate(ts, err, p90, params, initial_rate=None, trajectory=False, max_hold=None):
+    """
+    Replay the poll loop for every parameter set in `params` (dict of arrays, see grid()).
+    Returns decisions, time_full_s, incidents, reaction_delay_{mean,max}_s (K,)
+    and, with trajectory=True, rates (T, K).
+
+    Only ticks with both signals are iterated: the rate cannot change in between,
+    so gaps are accounted for in one step. An incident starts on the first tick
+    with a bump signal and ends on the first valid tick without one; its reaction
+    delay is the time until the rate reaches MAX_RATE (0 if already there).
+
+    A rate holds for at most `max_hold` seconds (default: the controller's WINDOW)
+    past its valid tick: longer gaps in the recording (e.g. days between NDJSON
+    files) are not counted in time_full_s.
+    """
+    ts = np.asarray(ts, dtype=float)
+    err = np.asarray(err, dtype=float)
+    p90 = np.asarray(p90, dtype=float)
+    p = {n: np.asarray(params.get(n, PARAMS[n]), dtype=float) for n in PARAMS}
+    k = max(v.size for v in p.values())
+    p = {n: np.broadcast_to(v, (k,)) for n, v in p.items()}
+    T = len(ts)
+
+    rate = np.full(k, p['MAX_RATE'] if initial_rate is None else initial_rate, dtype=float)
+    last_change = np.full(k, -np.inf)
+    decisions = np.zeros(k, dtype=int)
+    time_full = np.zeros(k)
+    onset = np.full(k, np.nan)       # start of the current incident
+    reacted = np.zeros(k, dtype=bool)
+    incidents = np.zeros(k, dtype=int)
+    delay_sum = np.zeros(k)
+    delay_count = np.zeros(k, dtype=int)
+    delay_max = np.full(k, np.nan)
+
+    # Same skip rule as the loop: no decision when a signal is missing or p90 is NaN
+    valid_idx = np.flatnonzero(~np.isnan(err) & ~np.isnan(p90))
+    if T > 1:
+        dt = np.diff(ts, append=ts[-1] + np.median(np.diff(ts)))
+    else:
+        dt = np.zeros(T)
+    # Duration during which the rate set at valid tick n holds (until the next valid tick)
+    cum_dt = np.concatenate(([0.0], np.cumsum(dt)))
+    bounds = np.append(valid_idx, T)
+    max_hold = ctrl.WINDOW_SEC if max_hold is None else max_hold
+    hold = np.minimum(cum_dt[bounds[1:]] - cum_dt[bounds[:-1]], max_hold)
+    lead = min(cum_dt[bounds[0]], max_hold)  # before the first valid tick, at the initial rate
+    time_full += lead * (rate >= p['MAX_RATE'])
+    if trajectory:
+        rates_valid = np.empty((len(valid_idx), k))
+
+    for n, i in enumerate(valid_idx):
+        up = (err[i] > p['ERR_HIGH']) | (p90[i] > p['LAT_HIGH'])
+        down = ~up & (err[i] < p['ERR_LOW']) & (p90[i] < p['LAT_LOW'])
+        nr = np.where(up, np.minimum(p['MAX_RATE'], rate + p['STEP']),
+                      np.maximum(p['MIN_RATE'], rate - p['STEP']))
+        nr = np.round(nr, 3)
+        change = (up | down) & (nr != rate) & (ts[i] - last_change >= p['COOLDOWN_SEC'])
+        rate = np.where(change, nr, rate)
+        last_change = np.where(change, ts[i], last_change)
+        decisions += change
+
+        # Incident bookkeeping
+        start = up & np.isnan(onset)
+        incidents += start
+        onset = np.where(start, ts[i], onset)
+        reacted &= ~start
+        onset = np.where(up, onset, np.nan)
+        hit = up & ~reacted & (rate >= p['MAX_RATE'])
+        delay = np.where(hit, ts[i] - onset, 0.0)
+        delay_sum += delay
+        delay_count += hit
+        delay_max = np.where(hit, np.fmax(delay_max, delay), delay_max)
+        reacted |= hit
+
+        time_full += hold[n] * (rate >= p['MAX_RATE'])
+        if trajectory:
+            rates_valid[n] = rate
+
+    delay_mean = np.where(delay_count > 0, delay_sum / np.maximum(delay_count, 1), np.nan)
+    out = {
+        'decisions': decisions,
+        'time_full_s': time_full,
+        'incidents': incidents,
+        'reaction_delay_mean_s': delay_mean,
+        'reaction_delay_max_s': delay_max,
+    }
+    if trajectory:
+        # Forward-fill: tick t holds the rate of the last valid tick <= t
+        initial = np.full((1, k), p['MAX_RATE'] if initial_rate is None else initial_rate, dtype=float)
+        pos = np.searchsorted(valid_idx, np.arange(T), side='right')
+        out['rates'] = np.vstack([initial, rates_valid])[pos]
+    return out
+
+
+def _parse_values(spec: str):
+    # "a,b,c" or "start:stop:num" (inclusive linspace)
+    if ':' in spec:
+        start, stop, num = spec.split(':')
+        return np.round(np.linspace(float(start), float(stop), int(num)), 6)
+    return [float(v) for v in spec.split(',')]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Replay controller decisions over recorded err/p90 series')
+    ap.add_argument('--err', help='query_range JSON for the error rate')
+    ap.add_argument('--p90', help='query_range JSON for p90 latency (seconds)')
+    ap.add_argument('--logs', help='NDJSON logs (alternative to --err/--p90)')
+    ap.add_argument('--interval', type=float, default=float(ctrl.INTERVAL), help='tick for --logs (s)')
+    ap.add_argument('--window', default=ctrl.WINDOW,
+                    help='trailing window for --logs (e.g. 30s), also the longest gap counted as held rate')
+    ap.add_argument('--initial-rate', type=float, default=None)
+    ap.add_argument('--sweep', action='append', default=[], metavar='NAME=VALUES',
+                    help=f'one of {",".join(PARAMS)}; VALUES is "a,b,c" or "start:stop:num"')
+    ap.add_argument('--trajectory', action='store_true', help='include the rate trajectory per config')
+    args = ap.parse_args(argv)
+
+    try:
+        window = ctrl.parse_duration(args.window)
+    except ValueError:
+        window = 0.0
+    if not window > 0:
+        ap.error(f'invalid --window {args.window!r} (PromQL duration, e.g. 30s or 1m30s)')
+
+    values = {}
+    for s in args.sweep:
+        name, _, spec = s.partition('=')
+        if name not in PARAMS:
+            ap.error(f'unknown parameter {name}')
+        try:
+            values[name] = _parse_values(spec)
+        except ValueError:
+            ap.error(f'invalid values for {name}: {spec!r} (expected "a,b,c" or "start:stop:num")')
+
+    if args.logs:
+        ts, err, p90 = load_ndjson(args.logs, args.interval, window)
+    elif args.err and args.p90:
+        ts, err, p90 = align(load_prom_range(args.err), load_prom_range(args.p90))
+    else:
+        ap.error('either --logs or both --err and --p90 are required')
+
+    params = grid(**values)
+    out = simulate(ts, err, p90, params, initial_rate=args.initial_rate, trajectory=args.trajectory,
+                   max_hold=window)
+
+    for j in range(len(out['decisions'])):
+        row = {n: float(params[n][j]) for n in PARAMS}
+        row['decisions'] = int(out['decisions'][j])
+        row['time_full_s'] = float(out['time_full_s'][j])
+        row['incidents'] = int(out['incidents'][j])
+        for key in ('reaction_delay_mean_s', 'reaction_delay_max_s'):
+            delay = out[key][j]
+            row[key] = None if np.isnan(delay) else float(delay)
+        if args.trajectory:
+            row['ts'] = ts.tolist()
+            row['rates'] = out['rates'][:, j].tolist()
+        sys.stdout.write(json.dumps(row) + '\n')
+
+
+if __name__ == '__main__':
+    main()
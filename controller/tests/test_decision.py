@@ -49,3 +49,156 @@ def test_low_err_low_lat_triggers_decay(monkeypatch):
     nr = mod.adjust(before, up=False)
     assert nr < before
 
+
+
+def test_budget_target_scales_rate_to_budget(monkeypatch):
+    monkeypatch.setattr(mod, 'BUDGET_EVENTS', 100.0)
+    monkeypatch.setattr(mod, 'BUDGET_BYTES', 0.0)
+    # 400 ev/s at rate 0.8 -> 100 ev/s needs rate 0.2
+    assert mod.budget_target(0.8, 400.0, None) == 0.2
+    # Under budget -> rate grows by at most STEP per decision
+    assert mod.budget_target(0.5, 10.0, None) == mod.adjust(0.5, up=True)
+    assert mod.budget_target(0.95, 10.0, None) == mod.MAX_RATE
+
+
+def test_budget_target_takes_tightest_budget_and_clamps(monkeypatch):
+    monkeypatch.setattr(mod, 'BUDGET_EVENTS', 100.0)
+    monkeypatch.setattr(mod, 'BUDGET_BYTES', 1000.0)
+    assert mod.budget_target(1.0, 200.0, 4000.0) == max(mod.MIN_RATE, 0.25)
+    assert mod.budget_target(1.0, 1e6, None) == mod.MIN_RATE
+    # No signal -> no decision
+    assert mod.budget_target(1.0, None, None) is None
+
+
+def test_poll_once_bumps_on_high_error(monkeypatch):
+    monkeypatch.setattr(mod, 'rate', 0.5)
+    monkeypatch.setattr(mod, 'last_change_ts', 0.0)
+    monkeypatch.setattr(mod, '_applied_rate', 0.5)
+    applied = []
+
+    def fake_set_rate(r):
+        # The outbound push must not hold the state lock
+        assert not mod.STATE_LOCK.locked()
+        applied.append(r)
+        return True
+
+    monkeypatch.setattr(mod, 'prom_query', lambda q: 0.05 if 'histogram_quantile' in q else 0.2)
+    monkeypatch.setattr(mod, 'set_rate', fake_set_rate)
+    mod.poll_once()
+    assert mod.rate == mod.adjust(0.5, up=True)
+    assert applied == [mod.rate]
+
+
+def test_budget_loop_converges_with_lagged_volume(monkeypatch):
+    # 400 ev/s at full sampling, 100 ev/s budget, volume averaged over WINDOW
+    monkeypatch.setattr(mod, 'MODE', 'budget')
+    monkeypatch.setattr(mod, 'BUDGET_EVENTS', 100.0)
+    monkeypatch.setattr(mod, 'BUDGET_BYTES', 0.0)
+    monkeypatch.setattr(mod, 'rate', 1.0)
+    monkeypatch.setattr(mod, 'last_change_ts', 0.0)
+    monkeypatch.setattr(mod, '_applied_rate', 1.0)
+    monkeypatch.setattr(mod, 'set_rate', lambda r: True)
+    clock = {'now': 1000.0}
+    history = [1.0] * int(mod.WINDOW_SEC)  # per-second rate applied at go-api
+
+    def fake_query(q):
+        if 'vector_component' in q:
+            window = history[-int(mod.WINDOW_SEC):]
+            return 400.0 * sum(window) / len(window)
+        if 'histogram_quantile' in q:
+            return (mod.LAT_LOW + mod.LAT_HIGH) / 2  # no err/latency signal
+        return (mod.ERR_LOW + mod.ERR_HIGH) / 2
+
+    monkeypatch.setattr(mod, 'prom_query', fake_query)
+    monkeypatch.setattr(mod, 'time', types.SimpleNamespace(time=lambda: clock['now']))
+    rates = []
+    for _ in range(100):
+        mod.poll_once()
+        rates.append(mod.rate)
+        for _ in range(mod.INTERVAL):
+            history.append(mod.rate)
+            clock['now'] += 1
+
+    assert all(abs(r - 0.25) <= 0.02 for r in rates[-50:])
+
+
+def test_parse_duration_promql_grammar():
+    assert mod.parse_duration('30s') == 30
+    assert mod.parse_duration('1m30s') == 90
+    assert mod.parse_duration('500ms') == 0.5
+    assert mod.parse_duration('1d') == 86400
+    assert mod.parse_duration('1w2d') == 9 * 86400
+    assert mod.parse_duration('1y') == 365 * 86400
+    assert mod.parse_duration('1h1m1s1ms') == 3661.001
+    assert mod.parse_duration('15') == 15
+    assert mod.parse_duration('1.5') == 1.5
+    for bad in ('', '1.5m', '30s1m', '1m1m', 'm', '1x'):
+        try:
+            mod.parse_duration(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f'{bad!r} accepted')
+
+
+def test_budget_mode_without_volume_falls_back_to_decay(monkeypatch):
+    monkeypatch.setattr(mod, 'MODE', 'budget')
+    monkeypatch.setattr(mod, 'BUDGET_EVENTS', 100.0)
+    monkeypatch.setattr(mod, 'rate', 1.0)
+    monkeypatch.setattr(mod, 'last_change_ts', 0.0)
+    monkeypatch.setattr(mod, '_applied_rate', 1.0)
+    monkeypatch.setattr(mod, 'set_rate', lambda r: True)
+
+    def fake_query(q):
+        if 'vector_component' in q:
+            return None  # empty Vector query
+        return 0.0  # low err, low latency -> decay signal
+
+    monkeypatch.setattr(mod, 'prom_query', fake_query)
+    mod.poll_once()
+    assert mod.rate == mod.adjust(1.0, up=False)
+
+
+def test_check_config_rejects_unusable_modes(monkeypatch):
+    for mode, events in (('steps', 100.0), ('budget', 0.0)):
+        monkeypatch.setattr(mod, 'MODE', mode)
+        monkeypatch.setattr(mod, 'BUDGET_EVENTS', events)
+        monkeypatch.setattr(mod, 'BUDGET_BYTES', 0.0)
+        try:
+            mod.check_config()
+        except ValueError:
+            continue
+        raise AssertionError(f'{mode} accepted')
+    monkeypatch.setattr(mod, 'MODE', 'budget')
+    monkeypatch.setattr(mod, 'BUDGET_EVENTS', 100.0)
+    mod.check_config()
+
+
+def test_apply_rate_retries_failed_and_forced_pushes(monkeypatch):
+    monkeypatch.setattr(mod, 'rate', 0.5)
+    monkeypatch.setattr(mod, '_applied_rate', 1.0)
+    monkeypatch.setattr(mod, '_force_pending', False)
+    ok = {'value': False}
+    applied = []
+
+    def fake_set_rate(r):
+        applied.append(r)
+        return ok['value']
+
+    monkeypatch.setattr(mod, 'set_rate', fake_set_rate)
+    mod.apply_rate()
+    assert applied == [0.5] and mod._applied_rate == 1.0  # failed: not recorded
+    ok['value'] = True
+    mod.apply_rate()
+    assert applied == [0.5, 0.5] and mod._applied_rate == 0.5
+
+    # A force arriving while a push is in flight is replayed by the pusher
+    applied.clear()
+    def slow_set_rate(r):
+        applied.append(r)
+        if len(applied) == 1:
+            mod.apply_rate(force=True)  # APPLY_LOCK held: returns at once
+        return True
+
+    monkeypatch.setattr(mod, 'set_rate', slow_set_rate)
+    mod.apply_rate(force=True)
+    assert applied == [0.5, 0.5] and not mod._force_pending
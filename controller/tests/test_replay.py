@@ -0,0 +1,100 @@
+import importlib
+
+import numpy as np
+
+mod = importlib.import_module('app')
+replay = importlib.import_module('replay')
+
+
+def scalar_loop(err, p90, rate):
+    # Reference: the live poll loop, one tick at a time
+    out, decisions = [], 0
+    for e, p in zip(err, p90):
+        signal = mod.decide(e, p)
+        if signal is not None:
+            nr = mod.adjust(rate, up=(signal == 'bump'))
+            if nr != rate:
+                rate = nr
+                decisions += 1
+        out.append(rate)
+    return out, decisions
+
+
+def test_replay_matches_poll_loop(monkeypatch):
+    rng = np.random.default_rng(0)
+    ts = np.arange(0, 600, 3.0)
+    err = rng.uniform(0, 0.12, len(ts))
+    p90 = rng.uniform(0.05, 0.5, len(ts))
+    p90[::17] = np.nan
+
+    params = replay.grid(ERR_HIGH=[0.03, 0.05, 0.08], STEP=[0.05, 0.1, 0.25])
+    out = replay.simulate(ts, err, p90, params, initial_rate=0.5, trajectory=True)
+
+    for j in range(len(params['STEP'])):
+        monkeypatch.setattr(mod, 'ERR_HIGH', params['ERR_HIGH'][j])
+        monkeypatch.setattr(mod, 'STEP', params['STEP'][j])
+        expected, decisions = scalar_loop(err, p90, 0.5)
+        assert out['rates'][:, j].tolist() == expected
+        assert out['decisions'][j] == decisions
+
+
+def test_replay_metrics_and_cooldown():
+    ts = np.arange(0, 60, 1.0)
+    err = np.where((ts >= 10) & (ts < 40), 0.2, 0.0)
+    p90 = np.full(len(ts), 0.1)
+    params = replay.grid(MIN_RATE=[0.1], MAX_RATE=[1.0], STEP=[0.3], COOLDOWN_SEC=[0, 5])
+    out = replay.simulate(ts, err, p90, params, initial_rate=0.1)
+
+    # 0.1 -> 0.4 -> 0.7 -> 1.0 : three bumps from t=10
+    assert out['reaction_delay_mean_s'].tolist() == [2.0, 10.0]
+    assert 'rates' not in out
+    assert out['time_full_s'].tolist() == [28.0, 20.0]
+    # three bumps, then three decays once the incident is over
+    assert out['decisions'].tolist() == [6, 6]
+
+
+def test_replay_reaction_per_incident_and_gaps():
+    # Two incidents separated by a quiet period long enough to decay back to MIN_RATE,
+    # with NaN gaps (no decision) in between
+    ts = np.arange(0, 120, 1.0)
+    err = np.zeros(len(ts))
+    err[0:30] = 0.2
+    err[80:100] = 0.2
+    p90 = np.full(len(ts), 0.1)
+    p90[40:50] = np.nan
+    params = replay.grid(MIN_RATE=[0.1], MAX_RATE=[1.0], STEP=[0.3, 0.9])
+    out = replay.simulate(ts, err, p90, params, initial_rate=1.0, trajectory=True)
+
+    assert out['incidents'].tolist() == [2, 2]
+    # first incident starts at full sampling (0s), second needs 3 bumps / 1 bump
+    assert out['reaction_delay_mean_s'].tolist() == [1.0, 0.0]
+    assert out['reaction_delay_max_s'].tolist() == [2.0, 0.0]
+    rates = out['rates'][:, 0]
+    assert rates[40:50].tolist() == [rates[39]] * 10
+    full = (rates >= 1.0).sum()
+    assert out['time_full_s'][0] == full
+
+
+def test_replay_caps_hold_over_recording_gaps():
+    # Two 60s recordings one day apart, full sampling throughout
+    ts = np.concatenate([np.arange(0, 60, 1.0), 86400 + np.arange(0, 60, 1.0)])
+    err = np.zeros(len(ts))
+    p90 = np.full(len(ts), 0.3)  # between LAT_LOW and LAT_HIGH: no decision
+    params = replay.grid(MAX_RATE=[1.0])
+    out = replay.simulate(ts, err, p90, params, initial_rate=1.0, max_hold=30.0)
+    # 59 + 59 one-second holds, plus at most 30s past the last tick of the first file
+    # and the median tick after the last one
+    assert out['time_full_s'].tolist() == [59 + 30 + 59 + 1]
+
+
+def test_replay_cli_rejects_malformed_values(capsys):
+    for argv in (['--logs', 'x.ndjson', '--window', '1x'],
+                 ['--err', 'e.json', '--p90', 'p.json', '--sweep', 'STEP=a'],
+                 ['--err', 'e.json', '--p90', 'p.json', '--sweep', 'STEP=0:1']):
+        try:
+            replay.main(argv)
+        except SystemExit as e:
+            assert e.code == 2
+        else:
+            raise AssertionError(f'{argv} accepted')
+    assert 'invalid values for STEP' in capsys.readouterr().err
@@ -13,6 +13,10 @@ from flask import Flask, render_template, jsonify, request
 from datetime import datetime
 import subprocess
 import threading
+import gzip
+import math
+import re
+from collections import OrderedDict
 from requests.models import Response
 
 app = Flask(__name__)
@@ -119,6 +123,182 @@ class LoadGenerator:
         except Exception as e:
             return False, f"Erreur: {str(e)}"
 
+# Cache du proxy Prometheus
+PROM_CHUNK_POINTS = int(os.getenv('PROM_CHUNK_POINTS', '720'))        # points par chunk
+PROM_MAX_FETCH_POINTS = int(os.getenv('PROM_MAX_FETCH_POINTS', '10000'))  # limite Prometheus ~11000
+PROM_MAX_POINTS = int(os.getenv('PROM_MAX_POINTS', '11000'))          # points max par requête (step >= plage/11000)
+PROM_CACHE_MAX_CHUNKS = int(os.getenv('PROM_CACHE_MAX_CHUNKS', '2000'))
+PROM_CACHE_MAX_POINTS = int(os.getenv('PROM_CACHE_MAX_POINTS', '500000'))  # ~150 o par point en mémoire
+PROM_CACHE_TTL = float(os.getenv('PROM_CACHE_TTL', '600'))            # chunks complets
+PROM_CACHE_LIVE_TTL = float(os.getenv('PROM_CACHE_LIVE_TTL', '5'))    # chunks encore ouverts
+PROM_CACHE_SETTLE = float(os.getenv('PROM_CACHE_SETTLE', '30'))       # délai avant qu'un chunk soit figé
+PROM_INSTANT_TTL = float(os.getenv('PROM_INSTANT_TTL', '1'))
+GZIP_MIN_BYTES = int(os.getenv('GZIP_MIN_BYTES', '1024'))
+
+
+# Durée PromQL : unités décroissantes, chacune au plus une fois (ex: 1h30m, 500ms, 1d)
+# Même grammaire que controller/app.py (contextes Docker séparés, pas de module partagé)
+_DURATION_RE = re.compile(r'(?:(\d+)y)?(?:(\d+)w)?(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?(?:(\d+)ms)?')
+_DURATION_UNITS = (365 * 86400, 7 * 86400, 86400, 3600, 60, 1, 0.001)
+
+
+def parse_duration(value):
+    """Convertit une durée PromQL ('1m30s', '500ms', '1d') ou un nombre de secondes ('15', '1.5') en secondes"""
+    value = str(value).strip()
+    m = _DURATION_RE.fullmatch(value)
+    if value and m:
+        return float(sum(int(n) * u for n, u in zip(m.groups(), _DURATION_UNITS) if n))
+    return float(value)
+
+
+def lttb(points, threshold):
+    """Largest-Triangle-Three-Buckets : réduit une série [(ts, v, ...), ...] à `threshold` points"""
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return points
+    sampled = [points[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Moyenne du bucket suivant
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(points[j][0] for j in range(avg_start, avg_end)) / span
+        avg_y = sum(points[j][1] for j in range(avg_start, avg_end)) / span
+        # Point du bucket courant formant le plus grand triangle
+        ax, ay = points[a][0], points[a][1]
+        best, best_area = a, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(points[best])
+        a = best
+    sampled.append(points[-1])
+    return sampled
+
+
+class PrometheusRangeCache:
+    """
+    Cache des query_range par chunks alignés sur le step.
+    Clé : (query, step, index du chunk). Une plage qui recoupe des plages déjà
+    demandées ne va chercher que les chunks manquants.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.chunks = OrderedDict()  # clé -> (expire_at, {labels_json: [[ts, 'v'], ...]}, nb_points)
+        self.points = 0              # total des points en cache (borne mémoire, requêtes multi-séries)
+        self.lock = threading.Lock()
+
+    def _get(self, key, now):
+        with self.lock:
+            entry = self.chunks.get(key)
+            if entry is None or entry[0] < now:
+                return None
+            self.chunks.move_to_end(key)
+            return entry[1]
+
+    def _put(self, key, series, ttl, now):
+        points = sum(len(values) for values in series.values())
+        with self.lock:
+            old = self.chunks.pop(key, None)
+            if old is not None:
+                self.points -= old[2]
+            self.chunks[key] = (now + ttl, series, points)
+            self.points += points
+            # LRU borné en nombre de chunks et en points (un chunk plus gros que la borne n'est pas gardé)
+            while self.chunks and (len(self.chunks) > PROM_CACHE_MAX_CHUNKS or self.points > PROM_CACHE_MAX_POINTS):
+                self.points -= self.chunks.popitem(last=False)[1][2]
+
+    def _fetch(self, query, start, end, step):
+        response = requests.get(f"{self.base_url}/api/v1/query_range",
+                                params={'query': query, 'start': start, 'end': end, 'step': step},
+                                timeout=30)
+        response.raise_for_status()
+        return response.json().get('data', {}).get('result', [])
+
+    def query_range(self, query, start, end, step):
+        """Retourne (result au format Prometheus, statut cache 'hit'|'partial'|'miss')"""
+        now = time.time()
+        end = min(end, now)
+        start = math.floor(start / step) * step
+        end = math.floor(end / step) * step
+        span = step * PROM_CHUNK_POINTS
+        first, last = int(start // span), int(end // span)
+
+        found, missing = {}, []
+        for idx in range(first, last + 1):
+            series = self._get((query, step, idx), now)
+            if series is None:
+                missing.append(idx)
+            else:
+                found[idx] = series
+        hits = len(found)
+
+        # Regrouper les chunks manquants contigus en un minimum de requêtes
+        max_run = max(1, PROM_MAX_FETCH_POINTS // PROM_CHUNK_POINTS)
+        runs = []
+        for idx in missing:
+            if runs and idx == runs[-1][-1] + 1 and len(runs[-1]) < max_run:
+                runs[-1].append(idx)
+            else:
+                runs.append([idx])
+        # Ne jamais demander de points dans le futur : Prometheus les évaluerait par lookback
+        now_aligned = math.floor(now / step) * step
+        for run in runs:
+            fetched = {idx: {} for idx in run}
+            result = self._fetch(query, run[0] * span, min((run[-1] + 1) * span - step, now_aligned), step)
+            for s in result:
+                labels = json.dumps(s.get('metric', {}), sort_keys=True)
+                for ts, v in s.get('values', []):
+                    idx = min(max(int(ts // span), run[0]), run[-1])
+                    fetched[idx].setdefault(labels, []).append([ts, v])
+            for idx, series in fetched.items():
+                settled = (idx + 1) * span <= now - PROM_CACHE_SETTLE
+                self._put((query, step, idx), series, PROM_CACHE_TTL if settled else PROM_CACHE_LIVE_TTL, now)
+                found[idx] = series
+
+        merged = {}
+        for idx in sorted(found):
+            for labels, values in found[idx].items():
+                merged.setdefault(labels, []).extend(v for v in values if start <= v[0] <= end)
+        result = [{'metric': json.loads(labels), 'values': values}
+                  for labels, values in merged.items() if values]
+        status = 'hit' if not missing else ('partial' if hits else 'miss')
+        return result, status
+
+
+class InstantQueryCache:
+    """Cache TTL court pour /api/v1/query (même requête dans la même fenêtre de TTL)"""
+
+    def __init__(self, base_url, ttl):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def query(self, query):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(query)
+            if entry and entry[0] > now:
+                return entry[1], entry[2], 'hit'
+        response = requests.get(f"{self.base_url}/api/v1/query", params={'query': query}, timeout=10)
+        payload = response.json() if response.ok else None
+        if response.ok:
+            with self.lock:
+                # Purge des entrées expirées pour borner la taille
+                self.entries = {q: e for q, e in self.entries.items() if e[0] > now}
+                self.entries[query] = (now + self.ttl, payload, response.status_code)
+        return payload, response.status_code, 'miss'
+
+
+range_cache = PrometheusRangeCache(SERVICES['prometheus'])
+instant_cache = InstantQueryCache(SERVICES['prometheus'], PROM_INSTANT_TTL)
+
+
 @app.route('/')
 def index():
     """Page principale de démonstration"""
@@ -214,19 +394,77 @@ def set_sampling():
 
 @app.route('/api/prometheus/query')
 def prometheus_query():
-    """Requêtes Prometheus via l'API existante"""
+    """Requêtes Prometheus instantanées (cache TTL court)"""
     try:
         query = request.args.get('query', 'up')
-        response = requests.get(f"{SERVICES['prometheus']}/api/v1/query", 
-                              params={'query': query}, timeout=10)
-        
-        if response.ok:
-            return jsonify(response.json())
+        payload, status_code, cache_status = instant_cache.query(query)
+        if payload is not None:
+            response = jsonify(payload)
+            response.headers['X-Cache'] = cache_status
+            return response
         else:
-            return jsonify({'error': f'Erreur {response.status_code}'}), response.status_code
+            return jsonify({'error': f'Erreur {status_code}'}), status_code
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/prometheus/query_range')
+def prometheus_query_range():
+    """
+    Requêtes Prometheus sur une plage, servies depuis le cache par chunks.
+    Paramètres : query, start, end (unix s), step (ex: 1, 15s, 1m), width (px, optionnel → LTTB)
+    """
+    try:
+        query = request.args.get('query')
+        if not query:
+            return jsonify({'error': 'Requête manquante'}), 400
+        now = time.time()
+        try:
+            end = float(request.args.get('end', now))
+            start = float(request.args.get('start', end - 3600))
+            step = parse_duration(request.args.get('step', '15'))
+        except ValueError as e:
+            return jsonify({'error': f'Paramètre invalide: {e}'}), 400
+        if not all(math.isfinite(v) for v in (start, end, step)) or step <= 0 or start > end:
+            return jsonify({'error': 'Plage invalide'}), 400
+        if (end - start) / step > PROM_MAX_POINTS:
+            return jsonify({'error': f'Plage trop large pour ce step (max {PROM_MAX_POINTS} points, step >= {(end - start) / PROM_MAX_POINTS:.3f}s)'}), 400
+
+        result, cache_status = range_cache.query_range(query, start, end, step)
+
+        width = request.args.get('width', type=int)
+        if width is not None and width > 0:
+            width = max(width, 3)  # LTTB garde toujours le premier et le dernier point
+            for series in result:
+                points = [(float(ts), float(v), v) for ts, v in series['values'] if math.isfinite(float(v))]
+                if len(points) > width:
+                    points = lttb(points, width)
+                series['values'] = [[ts, raw] for ts, _, raw in points]
+
+        response = jsonify({'status': 'success', 'data': {'resultType': 'matrix', 'result': result}})
+        response.headers['X-Cache'] = cache_status
+        return response
+    except requests.HTTPError as e:
+        return jsonify({'error': f'Erreur {e.response.status_code}'}), e.response.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.after_request
+def gzip_response(response):
+    """Compression gzip des réponses JSON volumineuses"""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = len(response.get_data())
+    response.vary.add('Accept-Encoding')
+    return response
+
 @app.route('/api/load', methods=['POST'])
 def generate_load():
     """Génération de charge via le script existant"""
@@ -318,5 +556,6 @@ def grafana_dashboards():
     return jsonify(dashboards)
 
 if __name__ == '__main__':
+    # Serveur de dev ; en production : gunicorn -c gunicorn.conf.py app:app
     # Port différent pour éviter les conflits
     app.run(host='0.0.0.0', port=8081, debug=True)
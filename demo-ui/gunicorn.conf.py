@@ -0,0 +1,12 @@
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8081')}"
+# One worker by default: the Prometheus range cache lives in-process (one cache per worker)
+workers = int(os.getenv('WORKERS', '1'))
+worker_class = 'gthread'
+threads = int(os.getenv('THREADS', '16'))
+keepalive = int(os.getenv('KEEPALIVE', '5'))
+timeout = int(os.getenv('TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '15'))
+accesslog = '-' if os.getenv('ACCESS_LOG', '0') == '1' else None
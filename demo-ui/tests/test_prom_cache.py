@@ -0,0 +1,122 @@
+import importlib
+import math
+import time
+
+mod = importlib.import_module('app')
+
+
+def make_fetch(calls):
+    def fake_fetch(query, start, end, step):
+        calls.append((start, end))
+        n = int(round((end - start) / step)) + 1
+        return [{'metric': {'job': 'x'},
+                 'values': [[start + i * step, str(start + i * step)] for i in range(n)]}]
+    return fake_fetch
+
+
+def fresh_cache(monkeypatch, calls):
+    cache = mod.PrometheusRangeCache('http://prometheus:9090')
+    monkeypatch.setattr(cache, '_fetch', make_fetch(calls))
+    return cache
+
+
+def test_miss_then_hit_then_partial(monkeypatch):
+    calls = []
+    cache = fresh_cache(monkeypatch, calls)
+    span = mod.PROM_CHUNK_POINTS
+    base = (int(time.time()) // span - 20) * span  # settled chunks, step=1
+
+    result, status = cache.query_range('q', base, base + 2 * span - 1, 1)
+    assert status == 'miss' and len(calls) == 1
+    assert len(result[0]['values']) == 2 * span
+
+    result, status = cache.query_range('q', base + 10, base + span + 10, 1)
+    assert status == 'hit' and len(calls) == 1
+    ts = [v[0] for v in result[0]['values']]
+    assert ts[0] == base + 10 and ts[-1] == base + span + 10
+    assert all(b - a == 1 for a, b in zip(ts, ts[1:]))  # contiguous across the chunk boundary
+
+    result, status = cache.query_range('q', base + span, base + 3 * span - 1, 1)
+    assert status == 'partial' and len(calls) == 2
+    assert calls[-1] == (base + 2 * span, base + 3 * span - 1)  # only the missing chunk
+    assert len(result[0]['values']) == 2 * span
+
+
+def test_chunk_split_and_no_future_fetch(monkeypatch):
+    calls = []
+    cache = fresh_cache(monkeypatch, calls)
+    now = time.time()
+    result, _ = cache.query_range('q', now - 3600, now + 600, 1)
+    assert all(end <= now for _, end in calls)
+    # Each cached chunk only holds points that belong to it
+    span = mod.PROM_CHUNK_POINTS
+    for (query, step, idx), (_, series, _) in cache.chunks.items():
+        for values in series.values():
+            assert all(idx * span <= v[0] < (idx + 1) * span for v in values)
+
+
+def test_ttl_expiry_and_lru_bound(monkeypatch):
+    calls = []
+    cache = fresh_cache(monkeypatch, calls)
+    monkeypatch.setattr(mod, 'PROM_CACHE_MAX_CHUNKS', 3)
+    span = mod.PROM_CHUNK_POINTS
+    base = (int(time.time()) // span - 50) * span
+    cache.query_range('q', base, base + 5 * span - 1, 1)
+    assert len(cache.chunks) == 3
+    assert {k[2] for k in cache.chunks} == {base // span + i for i in (2, 3, 4)}
+
+    for key, (_, series, points) in list(cache.chunks.items()):
+        cache.chunks[key] = (0.0, series, points)  # expired
+    _, status = cache.query_range('q', base + 4 * span, base + 5 * span - 1, 1)
+    assert status == 'miss'
+
+
+def test_lru_bound_by_points(monkeypatch):
+    calls = []
+    cache = fresh_cache(monkeypatch, calls)
+    span = mod.PROM_CHUNK_POINTS
+    monkeypatch.setattr(mod, 'PROM_CACHE_MAX_POINTS', 2 * span)
+    base = (int(time.time()) // span - 50) * span
+    cache.query_range('q', base, base + 5 * span - 1, 1)
+    assert len(cache.chunks) == 2 and cache.points == 2 * span
+    # A chunk larger than the whole bound is served but not kept
+    monkeypatch.setattr(mod, 'PROM_CACHE_MAX_POINTS', span - 1)
+    result, _ = cache.query_range('r', base, base + span - 1, 1)
+    assert len(result[0]['values']) == span
+    assert not cache.chunks and cache.points == 0
+
+
+def test_lttb_keeps_endpoints_and_length():
+    points = [(float(i), math.sin(i / 10.0)) for i in range(1000)]
+    out = mod.lttb(points, 100)
+    assert len(out) == 100
+    assert out[0] == points[0] and out[-1] == points[-1]
+    assert [p[0] for p in out] == sorted(p[0] for p in out)
+    assert mod.lttb(points[:50], 100) == points[:50]
+
+
+def test_query_range_endpoint_clamps_width(monkeypatch):
+    monkeypatch.setattr(mod.range_cache, '_fetch', make_fetch([]))
+    client = mod.app.test_client()
+    end = int(time.time()) - 3600
+    for width in (1, 2):
+        payload = client.get(f'/api/prometheus/query_range?query=w{width}&start={end - 600}&end={end}&step=1&width={width}').get_json()
+        values = payload['data']['result'][0]['values']
+        assert len(values) == 3
+        assert values[0][0] == end - 600 and values[-1][0] == end
+
+
+def test_query_range_endpoint_rejects_bad_params(monkeypatch):
+    client = mod.app.test_client()
+    assert client.get('/api/prometheus/query_range?query=up&step=abc').status_code == 400
+    assert client.get('/api/prometheus/query_range?query=up&start=x').status_code == 400
+    assert client.get('/api/prometheus/query_range?query=up&start=0&end=86400&step=1').status_code == 400
+    assert client.get('/api/prometheus/query_range').status_code == 400
+    assert client.get('/api/prometheus/query_range?query=up&step=1.5m').status_code == 400
+
+
+def test_parse_duration_promql_grammar():
+    assert mod.parse_duration('15') == 15
+    assert mod.parse_duration('1m30s') == 90
+    assert mod.parse_duration('500ms') == 0.5
+    assert mod.parse_duration('1d') == 86400
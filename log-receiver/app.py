@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Asyncio TCP log receiver: drop-in for Vector's `app_logs` socket source in local setups.
+
+- many concurrent connections, newline framing with a bounded line buffer
+- bounded queue between readers and a single writer (backpressure = readers stop reading)
+- batched writelines to NDJSON, rotated by size and/or age
+- per-connection throughput/backpressure counters (JSON logs) + aggregate /metrics
+"""
+
+import os
+import json
+import time
+import socket
+import asyncio
+import signal
+from datetime import datetime, timezone
+from prometheus_client import Counter, Gauge, start_http_server
+
+LISTEN_HOST = os.getenv('LISTEN_HOST', '0.0.0.0')
+LISTEN_PORT = int(os.getenv('LISTEN_PORT', '9000'))
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9100'))
+OUT_PATH = os.getenv('OUT_PATH', '/var/log/app-logs.ndjson')
+
+MAX_LINE_BYTES = int(os.getenv('MAX_LINE_BYTES', '65536'))
+QUEUE_MAX = int(os.getenv('QUEUE_MAX', '10000'))           # lines buffered between readers and writer
+BATCH_LINES = int(os.getenv('BATCH_LINES', '1000'))
+BATCH_BYTES = int(os.getenv('BATCH_BYTES', str(1 << 20)))
+FLUSH_SEC = float(os.getenv('FLUSH_SEC', '0.5'))
+
+ROTATE_BYTES = int(os.getenv('ROTATE_BYTES', str(100 << 20)))  # 0 = disabled
+ROTATE_SEC = float(os.getenv('ROTATE_SEC', '3600'))             # 0 = disabled
+ROTATE_KEEP = int(os.getenv('ROTATE_KEEP', '5'))
+
+# Re-encode like Vector's socket source + json codec (host, port, source_type, timestamp)
+ENRICH = os.getenv('ENRICH', '1') == '1'
+STATS_SEC = float(os.getenv('STATS_SEC', '10'))
+
+C_LINES = Counter('log_receiver_lines_total', 'Lines accepted')
+C_BYTES = Counter('log_receiver_bytes_total', 'Bytes accepted (framed lines)')
+C_DROPPED = Counter('log_receiver_dropped_total', 'Lines dropped', ['reason'])
+C_BACKPRESSURE = Counter('log_receiver_backpressure_waits_total', 'Reader waits on a full queue')
+C_BATCHES = Counter('log_receiver_batches_total', 'Batches written')
+C_ROTATIONS = Counter('log_receiver_rotations_total', 'File rotations')
+G_CONNECTIONS = Gauge('log_receiver_connections', 'Open connections')
+G_QUEUE = Gauge('log_receiver_queue_lines', 'Lines waiting to be written')
+
+
+def jlog(event: str, **fields):
+    try:
+        print(json.dumps({"event": event, **fields}), flush=True)
+    except Exception:
+        print('LOG', event, fields, flush=True)
+
+
+def enrich(line: bytes, host: str, port: int):
+    """Parse a JSON line and add Vector's socket source fields; None if not a JSON object."""
+    try:
+        ev = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(ev, dict):
+        return None
+    ev.setdefault('host', host)
+    ev.setdefault('port', port)
+    ev.setdefault('source_type', 'socket')
+    ev.setdefault('timestamp', datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
+    return (json.dumps(ev, separators=(',', ':')) + '\n').encode()
+
+
+class RotatingWriter:
+    """Append-only NDJSON file rotated by size and/or age: path -> path.<UTC timestamp>."""
+
+    def __init__(self, path, max_bytes=ROTATE_BYTES, max_age=ROTATE_SEC, keep=ROTATE_KEEP):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.keep = keep
+        self.f = None
+        self.size = 0
+        self.opened_at = 0.0
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.f = open(self.path, 'ab')
+        self.size = self.f.tell()
+        self.opened_at = time.time()
+
+    def _due(self, incoming: int) -> bool:
+        if self.size == 0:
+            return False
+        if self.max_bytes and self.size + incoming > self.max_bytes:
+            return True
+        return bool(self.max_age) and time.time() - self.opened_at >= self.max_age
+
+    def rotate(self):
+        self.f.close()
+        suffix = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        target, n = f'{self.path}.{suffix}', 1
+        while os.path.exists(target):
+            target, n = f'{self.path}.{suffix}.{n}', n + 1
+        os.replace(self.path, target)
+        C_ROTATIONS.inc()
+        jlog('rotate', path=target, bytes=self.size)
+        if self.keep:
+            d = os.path.dirname(self.path) or '.'
+            base = os.path.basename(self.path) + '.'
+            old = [os.path.join(d, f) for f in os.listdir(d) if f.startswith(base)]
+            old.sort(key=lambda f: (os.path.getmtime(f), f))  # oldest first (.10 sorts before .2 as text)
+            for f in old[:-self.keep]:
+                os.remove(f)
+        self._open()
+
+    def write_batch(self, lines):
+        size = sum(len(l) for l in lines)
+        if self._due(size):
+            self.rotate()
+        self.f.writelines(lines)
+        self.f.flush()
+        self.size += size
+
+    def reopen(self):
+        """Best-effort reopen after a failed write/rotation; retried on the next batch if it fails."""
+        try:
+            if self.f:
+                self.f.close()
+        except OSError:
+            pass
+        try:
+            self._open()
+        except OSError as e:
+            jlog('reopen_error', path=self.path, error=str(e))
+
+    def close(self):
+        if self.f:
+            self.f.close()
+
+
+class ConnStats:
+    def __init__(self, peer):
+        self.peer = peer
+        self.connected_at = time.time()
+        self.lines = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.backpressure_waits = 0
+        self.backpressure_sec = 0.0
+
+    def snapshot(self):
+        elapsed = max(time.time() - self.connected_at, 1e-9)
+        return {
+            'peer': self.peer,
+            'seconds': round(elapsed, 3),
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'dropped': self.dropped,
+            'lines_per_sec': round(self.lines / elapsed, 1),
+            'bytes_per_sec': round(self.bytes / elapsed, 1),
+            'backpressure_waits': self.backpressure_waits,
+            'backpressure_sec': round(self.backpressure_sec, 3),
+        }
+
+
+class LogReceiver:
+    def __init__(self, writer: RotatingWriter):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=QUEUE_MAX)
+        self.conns = {}
+        self.clients = set()
+        self.handlers = set()
+
+    async def _put(self, line: bytes, stats: ConnStats):
+        if self.queue.full():
+            # Backpressure: stop reading this socket until the writer drains the queue
+            stats.backpressure_waits += 1
+            C_BACKPRESSURE.inc()
+            t0 = time.monotonic()
+            await self.queue.put(line)
+            stats.backpressure_sec += time.monotonic() - t0
+        else:
+            self.queue.put_nowait(line)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername') or ('?', 0)
+        host, port = peer[0], peer[1]
+        stats = ConnStats(f'{host}:{port}')
+        self.conns[id(stats)] = stats
+        self.clients.add(writer)
+        self.handlers.add(asyncio.current_task())
+        G_CONNECTIONS.inc()
+        jlog('conn_open', peer=stats.peer)
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial  # EOF: flush an unterminated last line
+                    if not line:
+                        break
+                except asyncio.LimitOverrunError as e:
+                    # Line longer than MAX_LINE_BYTES: discard it up to the next newline
+                    # (counted first: EOF while discarding ends the connection)
+                    stats.dropped += 1
+                    C_DROPPED.labels(reason='oversized').inc()
+                    await reader.readexactly(e.consumed)
+                    while True:
+                        try:
+                            await reader.readuntil(b'\n')
+                            break
+                        except asyncio.LimitOverrunError as e2:
+                            await reader.readexactly(e2.consumed)
+                    continue
+                if not line.strip():
+                    continue
+                if not line.endswith(b'\n'):
+                    line += b'\n'
+                if ENRICH:
+                    out = enrich(line, host, port)
+                    if out is None:
+                        stats.dropped += 1
+                        C_DROPPED.labels(reason='invalid_json').inc()
+                        continue
+                    line = out
+                stats.lines += 1
+                stats.bytes += len(line)
+                C_LINES.inc()
+                C_BYTES.inc(len(line))
+                await self._put(line, stats)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.conns.pop(id(stats), None)
+            self.clients.discard(writer)
+            self.handlers.discard(asyncio.current_task())
+            G_CONNECTIONS.dec()
+            jlog('conn_closed', **stats.snapshot())
+            writer.close()
+
+    async def write_loop(self):
+        """Single writer: gather up to BATCH_LINES/BATCH_BYTES or FLUSH_SEC, then writelines off-loop.
+        A None in the queue flushes the pending batch and ends the loop."""
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            line = await self.queue.get()
+            if line is None:
+                break
+            batch, size = [line], len(line)
+            deadline = loop.time() + FLUSH_SEC
+            while len(batch) < BATCH_LINES and size < BATCH_BYTES:
+                try:
+                    line = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        line = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if line is None:
+                    done = True
+                    break
+                batch.append(line)
+                size += len(line)
+            try:
+                await loop.run_in_executor(None, self.writer.write_batch, batch)
+                C_BATCHES.inc()
+            except Exception as e:
+                # Keep draining the queue (readers would block forever otherwise): drop the batch
+                jlog('write_error', error=str(e), lines=len(batch))
+                C_DROPPED.labels(reason='write_error').inc(len(batch))
+                await loop.run_in_executor(None, self.writer.reopen)
+            G_QUEUE.set(self.queue.qsize())
+
+    async def close_clients(self):
+        for w in list(self.clients):
+            w.close()
+        await asyncio.gather(*(w.wait_closed() for w in list(self.clients)), return_exceptions=True)
+
+    async def shutdown(self, server, write_task):
+        """Stop accepting, close clients, let handlers queue what they already buffered, then flush."""
+        server.close()
+        await self.close_clients()
+        await asyncio.gather(*list(self.handlers), return_exceptions=True)
+        await server.wait_closed()
+        await self.queue.put(None)
+        await write_task
+        self.writer.close()
+
+    async def stats_loop(self):
+        while True:
+            await asyncio.sleep(STATS_SEC)
+            G_QUEUE.set(self.queue.qsize())
+            for stats in list(self.conns.values()):
+                jlog('conn_stats', **stats.snapshot())
+
+
+async def serve():
+    receiver = LogReceiver(RotatingWriter(OUT_PATH))
+    server = await asyncio.start_server(receiver.handle, LISTEN_HOST, LISTEN_PORT,
+                                        limit=MAX_LINE_BYTES, reuse_address=True)
+    for sock in server.sockets:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    jlog('receiver_start', listen=f'{LISTEN_HOST}:{LISTEN_PORT}', out=OUT_PATH,
+         batch={'lines': BATCH_LINES, 'bytes': BATCH_BYTES, 'flush_sec': FLUSH_SEC},
+         rotate={'bytes': ROTATE_BYTES, 'sec': ROTATE_SEC, 'keep': ROTATE_KEEP},
+         queue_max=QUEUE_MAX, max_line_bytes=MAX_LINE_BYTES, enrich=ENRICH)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    write_task = asyncio.create_task(receiver.write_loop())
+    stats_task = asyncio.create_task(receiver.stats_loop())
+    await stop.wait()
+
+    stats_task.cancel()
+    await receiver.shutdown(server, write_task)
+    jlog('receiver_stop')
+
+
+if __name__ == '__main__':
+    start_http_server(METRICS_PORT)
+    asyncio.run(serve())
@@ -0,0 +1,137 @@
+import asyncio
+import importlib
+import json
+import os
+
+from prometheus_client import REGISTRY
+
+mod = importlib.import_module('app')
+
+
+async def run_receiver(path, payloads, queue_max=None):
+    receiver = mod.LogReceiver(mod.RotatingWriter(str(path), max_bytes=0, max_age=0))
+    if queue_max:
+        receiver.queue = asyncio.Queue(maxsize=queue_max)
+    server = await asyncio.start_server(receiver.handle, '127.0.0.1', 0, limit=mod.MAX_LINE_BYTES)
+    port = server.sockets[0].getsockname()[1]
+    write_task = asyncio.create_task(receiver.write_loop())
+
+    async def client(data):
+        _, w = await asyncio.open_connection('127.0.0.1', port)
+        w.write(data)
+        await w.drain()
+        w.close()
+        await w.wait_closed()
+
+    await asyncio.gather(*(client(p) for p in payloads))
+    while receiver.conns:
+        await asyncio.sleep(0.01)
+    await receiver.shutdown(server, write_task)
+
+
+def test_concurrent_connections_framing_and_drops(tmp_path):
+    out = tmp_path / 'app-logs.ndjson'
+    good = b''.join(json.dumps({'msg': 'handled request', 'i': i}).encode() + b'\n' for i in range(200))
+    oversized = b'{"big": "' + b'x' * (mod.MAX_LINE_BYTES * 2) + b'"}\n'
+    payloads = [good] * 20 + [b'not json\n' + oversized + b'{"tail": 1}']
+    asyncio.run(run_receiver(out, payloads, queue_max=16))
+
+    lines = [json.loads(l) for l in out.read_text().splitlines()]
+    assert len(lines) == 20 * 200 + 1
+    assert all(ev['source_type'] == 'socket' and 'timestamp' in ev for ev in lines)
+    assert any(ev.get('tail') == 1 for ev in lines)
+
+
+def test_rotation_by_size_keeps_last_files(tmp_path):
+    out = tmp_path / 'app-logs.ndjson'
+    w = mod.RotatingWriter(str(out), max_bytes=100, max_age=0, keep=2)
+    for _ in range(5):
+        w.write_batch([b'x' * 60 + b'\n'])
+    w.close()
+    rotated = [f for f in os.listdir(tmp_path) if f.startswith('app-logs.ndjson.')]
+    assert len(rotated) == 2
+    assert out.stat().st_size == 61
+
+
+def test_shutdown_keeps_lines_buffered_in_handlers(tmp_path, monkeypatch):
+    out = tmp_path / 'app-logs.ndjson'
+    n = 5000
+
+    async def scenario():
+        receiver = mod.LogReceiver(mod.RotatingWriter(str(out), max_bytes=0, max_age=0))
+        receiver.queue = asyncio.Queue(maxsize=8)  # handlers back up behind the writer
+        server = await asyncio.start_server(receiver.handle, '127.0.0.1', 0, limit=mod.MAX_LINE_BYTES)
+        port = server.sockets[0].getsockname()[1]
+        write_task = asyncio.create_task(receiver.write_loop())
+        _, w = await asyncio.open_connection('127.0.0.1', port)
+        w.write(b'{"i": 1}\n' * n)
+        await w.drain()
+        while not receiver.queue.full():
+            await asyncio.sleep(0.001)
+        # Shut down while the handler still holds most lines in its StreamReader
+        await receiver.shutdown(server, write_task)
+        w.close()
+
+    asyncio.run(scenario())
+    assert len(out.read_text().splitlines()) == n
+
+
+def test_oversized_line_at_eof_is_counted(tmp_path):
+    out = tmp_path / 'app-logs.ndjson'
+    def dropped():
+        return REGISTRY.get_sample_value('log_receiver_dropped_total', {'reason': 'oversized'}) or 0.0
+
+    before = dropped()
+    asyncio.run(run_receiver(out, [b'{"ok": 1}\n' + b'x' * (mod.MAX_LINE_BYTES * 2)]))
+    assert dropped() == before + 1
+    assert len(out.read_text().splitlines()) == 1
+
+
+def test_rotation_prunes_by_age_not_name(tmp_path):
+    out = tmp_path / 'app-logs.ndjson'
+    # .10 sorts before .2 as text but is the newest
+    for i, name in enumerate(['app-logs.ndjson.20250101T000000.2', 'app-logs.ndjson.20250101T000000.10']):
+        p = tmp_path / name
+        p.write_text('x\n')
+        os.utime(p, (1000 + i, 1000 + i))
+    w = mod.RotatingWriter(str(out), max_bytes=10, max_age=0, keep=2)
+    w.write_batch([b'y' * 8 + b'\n'])
+    w.write_batch([b'z' * 8 + b'\n'])  # rotates: keeps .10 and the new file
+    w.close()
+    kept = sorted(f for f in os.listdir(tmp_path) if f.startswith('app-logs.ndjson.'))
+    assert 'app-logs.ndjson.20250101T000000.10' in kept
+    assert 'app-logs.ndjson.20250101T000000.2' not in kept
+    assert len(kept) == 2
+
+
+def test_write_error_drops_batch_and_keeps_draining(tmp_path, monkeypatch):
+    out = tmp_path / 'app-logs.ndjson'
+    monkeypatch.setattr(mod, 'BATCH_LINES', 5)
+
+    def dropped():
+        return REGISTRY.get_sample_value('log_receiver_dropped_total', {'reason': 'write_error'}) or 0.0
+
+    class FailingWriter(mod.RotatingWriter):
+        failures = 3
+
+        def write_batch(self, lines):
+            if FailingWriter.failures:
+                FailingWriter.failures -= 1
+                raise OSError(28, 'No space left on device')
+            super().write_batch(lines)
+
+    async def scenario():
+        receiver = mod.LogReceiver(FailingWriter(str(out), max_bytes=0, max_age=0))
+        receiver.queue = asyncio.Queue(maxsize=4)
+        write_task = asyncio.create_task(receiver.write_loop())
+        stats = mod.ConnStats('test')
+        for i in range(50):
+            await asyncio.wait_for(receiver._put(b'{"i": %d}\n' % i, stats), 2)
+        await receiver.queue.put(None)
+        await write_task
+
+    before = dropped()
+    asyncio.run(scenario())
+    written = len(out.read_text().splitlines())
+    assert dropped() - before == 50 - written
+    assert 0 < written < 50
@@ -71,5 +71,6 @@ def health():
     })
 
 if __name__ == '__main__':
+    # Dev server; production: gunicorn -c gunicorn.conf.py app:app
     print("Starting webhook service on port 8080", flush=True)
     app.run(host='0.0.0.0', port=8080, debug=False)
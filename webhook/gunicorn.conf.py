@@ -0,0 +1,11 @@
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('THREADS', '4'))
+keepalive = int(os.getenv('KEEPALIVE', '5'))
+timeout = int(os.getenv('TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT', '15'))
+accesslog = '-' if os.getenv('ACCESS_LOG', '0') == '1' else None